@@ -1,34 +1,136 @@
 from __future__ import annotations
 
+import abc
 import argparse
 import asyncio
-import io
+import codecs
+import contextlib
 import logging
+import os
 import pathlib
+import re
 import shutil
 import tarfile
+import tempfile
+import threading
+import time
 import zipfile
 from types import TracebackType
-from typing import Literal, Self, Type
-from urllib.parse import unquote, urljoin
+from typing import IO, Any, AsyncIterator, Callable, Literal, Self, Type, TypeVar
+from urllib.parse import unquote, urljoin, urlsplit
 
 import aiohttp
 import aiohttp_retry
-from lxml import html
+from lxml import etree, html
 from tqdm import tqdm
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 LOGGER = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+SONG_LINK_XPATH = etree.XPath(
+    "//*[contains(concat(' ', normalize-space(@class), ' '),"
+    " ' songDownloadLink ')]/parent::a/@href",
+    smart_strings=False,
+)
+INFO_XPATH = etree.XPath("string(//p[@align='left'])", smart_strings=False)
+TRACK_COUNT_RE = re.compile(r"Number of Files:\s*(\d+)")
+CONTENT_RANGE_RE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+DOWNLOAD_PAGE_XPATH = etree.XPath(
+    "//*[contains(concat(' ', normalize-space(@class), ' '),"
+    " ' playlistDownloadSong ')]/a[1]/@href",
+    smart_strings=False,
+)
+
+SPLIT_MIN_SIZE = 50 * 1024 * 1024
+
+# lxml parsers must not move between threads, so each thread keeps its own.
+THREAD_PARSERS = threading.local()
+
 
 class KHOutsiderError(Exception):
     """An Error type for problems occurring in imperative code in this module."""
 
+    __slots__ = ()
+
+
+class UnusableRangeError(KHOutsiderError):
+    """The server didn't answer a range request with exactly that range."""
+
+    __slots__ = ()
+
+
+class BackoffRetry(aiohttp_retry.ExponentialRetry):
+    """Exponential backoff that waits as long as the server asks, up to a limit."""
+
+    def get_timeout(
+        self, attempt: int, response: aiohttp.ClientResponse | None = None
+    ) -> float:
+        if response is not None and response.status in {429, 503}:
+            # Only the delay-seconds form; an HTTP date falls back to backoff.
+            with contextlib.suppress(KeyError, ValueError):
+                return min(float(response.headers["retry-after"]), 60.0)
+        return super().get_timeout(attempt, response)
+
+
+async def run_in_thread(func: Callable[..., T], *args: Any) -> T:
+    """Runs blocking code in a thread, waiting for it to finish even if cancelled.
+
+    A thread can't be interrupted, so returning early on cancellation would let
+    the caller close files the thread is still using.
+    """
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await future
+        raise
+
+
+def open_part(path: str, size: int | None, offset: int) -> IO[bytes]:
+    """Opens a part file to write after its first offset bytes.
+
+    If the final size is known, the file is preallocated on disk where the
+    filesystem supports it.
+    """
+    f = open(path, mode="r+b" if offset else "wb")
+    try:
+        if offset:
+            f.truncate(offset)
+            f.seek(offset)
+        if size and hasattr(os, "posix_fallocate"):
+            with contextlib.suppress(OSError):
+                os.posix_fallocate(f.fileno(), 0, size)
+    except BaseException:
+        f.close()
+        raise
+    return f
+
+
+def drop_cached(file: IO[bytes]) -> None:
+    """Flushes the file and lets the OS drop it from the page cache.
+
+    On Linux this also starts writing it out, which can block for a while.
+    """
+    file.flush()
+    with contextlib.suppress(OSError):
+        os.posix_fadvise(file.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
 
 class DirectoryOutput:
     """An output that stores files in a directory."""
 
+    # Whether opened files are real files that can be written at any offset.
+    random_access = True
+
     def __init__(self, output_directory: pathlib.Path, name: str) -> None:
         self.album_directory = output_directory / name
+        self.album_prefix = os.path.join(self.album_directory, "")
 
     async def __aenter__(self) -> Self:
         self.album_directory.mkdir(exist_ok=True)
@@ -42,16 +144,59 @@ class DirectoryOutput:
         exc_tb: TracebackType,
     ) -> Literal[False]:
         if exc_type is not None:
-            shutil.rmtree(self.album_directory, ignore_errors=True)
+            # Keep partial files so a later run can resume them.
+            with contextlib.suppress(OSError):
+                self.album_directory.rmdir()
         return False
 
-    def open(self, name: str) -> io.BufferedWriter:
-        """Open a file relative to the base directory."""
-        return (self.album_directory / name).open(mode="wb")
-
+    def completed(self, name: str, size: int | None) -> bool:
+        """Whether the file has already been downloaded with the given size."""
+        try:
+            return os.stat(self.album_prefix + name).st_size == size
+        except FileNotFoundError:
+            return False
 
-class TarOutput(DirectoryOutput):
-    """An output that stores files in a tar archive."""
+    def partial_size(self, name: str) -> int:
+        """How much of an interrupted download of the file is on disk."""
+        try:
+            return os.stat(f"{self.album_prefix}{name}.part").st_size
+        except FileNotFoundError:
+            return 0
+
+    @contextlib.asynccontextmanager
+    async def open(
+        self, name: str, size: int | None = None, offset: int = 0
+    ) -> AsyncIterator[IO[bytes]]:
+        """Open a file relative to the base directory.
+
+        The file is written under a .part suffix and only gets its real name once
+        it has been written successfully. If offset is given, writing continues
+        after that many bytes of an earlier partial download. If the final size
+        is known, the file is preallocated on disk.
+        """
+        path = self.album_prefix + name
+        part_path = f"{path}.part"
+        with await run_in_thread(open_part, part_path, size, offset) as f:
+            try:
+                yield f
+            except BaseException:
+                # Drop the preallocated tail so the part is safe to resume from.
+                f.truncate(f.tell())
+                raise
+            if hasattr(os, "posix_fadvise"):
+                await run_in_thread(drop_cached, f)
+        os.replace(part_path, path)
+
+
+class ArchiveOutput(DirectoryOutput, abc.ABC):
+    """Base for outputs that stream files into a single archive.
+
+    Subclasses open self.archive in __aenter__ and implement add.
+    """
+
+    random_access = False
+    archive: tarfile.TarFile | zipfile.ZipFile
+    archive_path: pathlib.Path
 
     async def __aexit__(
         self,
@@ -59,76 +204,360 @@ class TarOutput(DirectoryOutput):
         exc_val: BaseException,
         exc_tb: TracebackType,
     ) -> Literal[False]:
-        if exc_type is None:
-            with tarfile.open(self.album_directory.with_suffix(".tar"), mode="w") as f:
-                f.add(self.album_directory, self.album_directory.name)
-            LOGGER.info("Created tar archive for %s", self.album_directory.name)
-        shutil.rmtree(self.album_directory, ignore_errors=True)
+        self.archive.close()
+        if exc_type is not None:
+            self.archive_path.unlink(missing_ok=True)
         return False
 
+    def completed(self, name: str, size: int | None) -> bool:
+        """Archives are always written from scratch."""
+        return False
 
-class ZipOutput(DirectoryOutput):
-    """An output that stores files in a zip archive."""
+    def partial_size(self, name: str) -> int:
+        """Archives are always written from scratch."""
+        return 0
 
-    async def __aexit__(
-        self,
-        exc_type: Type[BaseException],
-        exc_val: BaseException,
-        exc_tb: TracebackType,
-    ) -> Literal[False]:
-        if exc_type is None:
-            with zipfile.ZipFile(
-                self.album_directory.with_suffix(".zip"), mode="w"
-            ) as f:
-                f.mkdir(self.album_directory.name)
-                for p in sorted(self.album_directory.iterdir()):
-                    f.write(p, p.relative_to(self.album_directory.parent))
-            LOGGER.info("Created zip archive for %s", self.album_directory.name)
-        shutil.rmtree(self.album_directory, ignore_errors=True)
-        return False
+    @contextlib.asynccontextmanager
+    async def open(
+        self, name: str, size: int | None = None, offset: int = 0
+    ) -> AsyncIterator[IO[bytes]]:
+        """Open a file that is added to the archive if written successfully.
 
+        Small files are kept in memory, larger ones spill over to a temporary file.
+        """
+        with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024) as f:
+            yield f
+            size = f.tell()
+            f.seek(0)
+            await run_in_thread(self.add, name, f, size)
 
-def get_song_link(download_doc: html.HtmlElement, prefer_flac: bool) -> str:
-    """Gets the URL of the song file from the document."""
-    audio_links = {
-        y[y.rindex(".") + 1 :]: y
-        for y in (
-            x.getparent().get("href")
-            for x in download_doc.find_class("songDownloadLink")
+    @abc.abstractmethod
+    def add(self, name: str, file: IO[bytes], size: int) -> None:
+        """Add the contents of file to the archive. Must be thread safe."""
+
+
+class TarOutput(ArchiveOutput):
+    """An output that streams files into a tar archive."""
+
+    async def __aenter__(self) -> Self:
+        self.archive_path = self.album_directory.with_suffix(".tar")
+        self.archive = tarfile.open(
+            self.archive_path,
+            mode="w|",
+            bufsize=1024 * 1024,
+            copybufsize=1024 * 1024,
         )
-    }
-    if prefer_flac and "flac" in audio_links:
-        audio_link = audio_links["flac"]
-    else:
+        self.lock = threading.Lock()
+        info = tarfile.TarInfo(self.album_directory.name)
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o755
+        info.mtime = int(time.time())
+        self.archive.addfile(info)
+        LOGGER.info("Created tar archive for %s", self.album_directory.name)
+        return self
+
+    def add(self, name: str, file: IO[bytes], size: int) -> None:
+        """Add the contents of file to the archive."""
+        info = tarfile.TarInfo(f"{self.album_directory.name}/{name}")
+        info.size = size
+        info.mode = 0o644
+        info.mtime = int(time.time())
+        with self.lock:
+            self.archive.addfile(info, file)
+
+
+class ZipOutput(ArchiveOutput):
+    """An output that streams files into a zip archive."""
+
+    async def __aenter__(self) -> Self:
+        self.archive_path = self.album_directory.with_suffix(".zip")
+        self.archive = zipfile.ZipFile(
+            self.archive_path, mode="w", compression=zipfile.ZIP_STORED
+        )
+        self.lock = threading.Lock()
+        self.archive.mkdir(self.album_directory.name)
+        LOGGER.info("Created zip archive for %s", self.album_directory.name)
+        return self
+
+    def add(self, name: str, file: IO[bytes], size: int) -> None:
+        """Add the contents of file to the archive."""
+        info = zipfile.ZipInfo(
+            f"{self.album_directory.name}/{name}", time.localtime()[:6]
+        )
+        info.compress_type = zipfile.ZIP_STORED
+        info.file_size = size
+        with self.lock, self.archive.open(info, mode="w") as f:
+            shutil.copyfileobj(file, f, 1024 * 1024)
+
+
+def parse_document(body: bytes, encoding: str) -> html.HtmlElement:
+    """Parses a page with this thread's parser for the encoding.
+
+    A parser is only kept for reuse if the parse succeeded, since it can't be
+    trusted to be reset otherwise.
+    """
+    try:
+        parsers = THREAD_PARSERS.by_encoding
+    except AttributeError:
+        parsers = THREAD_PARSERS.by_encoding = {}
+    parser = parsers.pop(encoding, None)
+    if parser is None:
+        parser_options = {
+            "remove_blank_text": True,
+            "remove_comments": True,
+            "remove_pis": True,
+            "collect_ids": False,
+        }
         try:
-            audio_link = audio_links["mp3"]
-        except KeyError:
-            raise ValueError("No song links found in page.")
-    return audio_link
+            parser = html.HTMLParser(encoding=encoding, **parser_options)
+        except LookupError:
+            # libxml2 doesn't know every name Python does.
+            parser = html.HTMLParser(encoding="utf-8", **parser_options)
+    parser.feed(body)
+    root = parser.close()
+    parsers[encoding] = parser
+    return root
+
+
+async def fetch_document(
+    url: str, session: aiohttp_retry.RetryClient
+) -> html.HtmlElement:
+    """Fetches the page at url and parses it in a worker thread."""
+    async with session.get(url) as resp:
+        body = await resp.read()
+    encoding = resp.charset or "utf-8"
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        encoding = "utf-8"
+    return await asyncio.to_thread(parse_document, body, encoding)
 
 
-async def download_file(
+def join_url(base: str, href: str) -> str:
+    """Resolves a link against the page it's on."""
+    if href.startswith(("https://", "http://")):
+        return href
+    return urljoin(base, href)
+
+
+def get_song_link(download_doc: html.HtmlElement, prefer_flac: bool) -> str:
+    """Gets the URL of the song file from the document."""
+    mp3_link = None
+    for href in SONG_LINK_XPATH(download_doc):
+        if href.endswith(".flac"):
+            if prefer_flac:
+                return href
+        elif mp3_link is None and href.endswith(".mp3"):
+            if not prefer_flac:
+                return href
+            mp3_link = href
+    if mp3_link is None:
+        raise ValueError("No song links found in page.")
+    return mp3_link
+
+
+def get_song_filename(audio_link: str) -> str | None:
+    """Gets the name of the song file from its URL, if the URL has a usable one."""
+    filename = unquote(urlsplit(audio_link).path.rsplit("/", 1)[-1])
+    if "." not in filename:
+        return None
+    return filename
+
+
+async def iter_batches(
+    content: aiohttp.StreamReader, size: int = 256 * 1024
+) -> AsyncIterator[bytearray]:
+    """Yields the body in pieces of at least size bytes, bar the last one.
+
+    Reads return whatever has arrived, which over TLS is often a few KiB. Each
+    piece costs a trip to a worker thread and a write syscall, so collect them.
+    """
+    batch = bytearray()
+    async for chunk in content.iter_chunked(size):
+        batch += chunk
+        if len(batch) >= size:
+            yield batch
+            batch = bytearray()
+    if batch:
+        yield batch
+
+
+def get_range_start(response: aiohttp.ClientResponse) -> int | None:
+    """Gets where the part of the file in a 206 response starts, if it says."""
+    match = CONTENT_RANGE_RE.match(response.headers.get("content-range", ""))
+    if match is None:
+        return None
+    return int(match[1])
+
+
+def write_at(fd: int, data: bytes | bytearray, offset: int) -> None:
+    """Writes all of data to fd at offset, without moving the file position."""
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+
+async def download_range(
     url: str,
     session: aiohttp_retry.RetryClient,
+    fd: int,
+    start: int,
+    end: int,
+    progress: tqdm,
+) -> int:
+    """Downloads bytes start up to end of the url into the same place in fd.
+
+    Returns how many bytes were downloaded. If the range fails, they are taken
+    back off the progress bar.
+    """
+    headers = {"Range": f"bytes={start}-{end - 1}"}
+    received = 0
+    try:
+        async with session.get(url, headers=headers) as response:
+            if response.status != 206:
+                raise UnusableRangeError(f"Server ignored range request for {url}")
+            if get_range_start(response) != start:
+                raise UnusableRangeError(f"Server sent the wrong range for {url}")
+            async for chunk in iter_batches(response.content):
+                await run_in_thread(write_at, fd, chunk, start + received)
+                received += len(chunk)
+                progress.update(len(chunk))
+        if received != end - start:
+            raise UnusableRangeError(f"Server sent the wrong range for {url}")
+    except BaseException as err:
+        progress.update(-received)
+        if isinstance(err, aiohttp.ClientResponseError) and err.status == 416:
+            raise UnusableRangeError(f"Server refused range request for {url}") from err
+        raise
+    return received
+
+
+async def download_stream(
+    url: str,
+    filename: str,
+    session: aiohttp_retry.RetryClient,
     output: DirectoryOutput,
     progress: tqdm,
+    offset: int,
 ) -> None:
-    """Downloads the given url to an automatically named file on disk."""
-    async with session.get(url) as response:
-        if "content-disposition" in response.headers:
-            header = response.headers["content-disposition"]
-            filename = header.split("filename=")[1]
-        else:
-            filename = url.split("/")[-1]
-
-        filename = unquote(filename)
-        progress.total += int(response.headers["content-length"])
+    """Downloads the url to the named file in a single request.
+
+    If offset is given, the rest of the file is appended to that many bytes of an
+    earlier partial download, as long as the server sends exactly that range.
+    """
+    headers = {"Range": f"bytes={offset}-"} if offset else None
+    async with session.get(url, headers=headers) as response:
+        if response.status != 206:
+            offset = 0
+        elif get_range_start(response) != offset:
+            LOGGER.warning("Server sent the wrong range for %s, restarting", url)
+            response.close()
+            return await download_stream(url, filename, session, output, progress, 0)
+        size = response.content_length
+        if size is not None and response.headers.get("content-encoding"):
+            size = None
+        if size is not None:
+            size += offset
+        progress.total += size or 0
+        progress.update(offset)
         progress.refresh()
-        with output.open(filename) as file:
-            # 10 MB chunks
-            async for chunk in response.content.iter_chunked(1024 * 1024 * 10):
-                file.write(chunk)
+        async with output.open(filename, size, offset) as file:
+            written = offset
+            async for chunk in iter_batches(response.content):
+                await run_in_thread(file.write, chunk)
+                written += len(chunk)
                 progress.update(len(chunk))
+            if size is not None and written != size:
+                raise KHOutsiderError(f"Got {written} of {size} bytes from {url}")
+
+
+async def download_file(
+    url: str,
+    filename: str | None,
+    session: aiohttp_retry.RetryClient,
+    output: DirectoryOutput,
+    progress: tqdm,
+    split: int,
+) -> None:
+    """Downloads the given url to the named file.
+
+    Without a filename, the one the server suggests is used. Files that were
+    already downloaded are skipped, and interrupted downloads are resumed if the
+    server supports it. Large files are downloaded as split concurrent ranges if
+    requested.
+    """
+    size = None
+    accept_ranges = False
+    try:
+        async with session.head(url) as head:
+            if filename is None and head.content_disposition:
+                if head.content_disposition.filename:
+                    filename = unquote(head.content_disposition.filename)
+            size = head.content_length
+            accept_ranges = head.headers.get("accept-ranges") == "bytes"
+    except aiohttp.ClientResponseError as err:
+        LOGGER.info("HEAD failed for %s, downloading it whole: %s", url, err)
+    if filename is None:
+        filename = unquote(url.rsplit("/", 1)[-1])
+    if output.completed(filename, size):
+        LOGGER.info(
+            "Skipped downloaded file in %s: %s",
+            output.album_directory.name,
+            filename,
+        )
+        return
+
+    offset = output.partial_size(filename) if accept_ranges else 0
+    # A part this long was preallocated by a killed download and can't be trusted.
+    if size is None or offset >= size:
+        offset = 0
+
+    if (
+        offset == 0
+        and split > 1
+        and accept_ranges
+        and size is not None
+        and size >= SPLIT_MIN_SIZE
+        and output.random_access
+        and hasattr(os, "pwrite")
+    ):
+        progress.total += size
+        progress.refresh()
+        tasks = []
+        try:
+            async with (
+                output.open(filename, size) as file,
+                asyncio.TaskGroup() as tg,
+            ):
+                for i in range(split):
+                    task = download_range(
+                        url,
+                        session,
+                        file.fileno(),
+                        i * size // split,
+                        (i + 1) * size // split,
+                        progress,
+                    )
+                    tasks.append(tg.create_task(task))
+        except ExceptionGroup as err:
+            progress.total -= size
+            progress.update(
+                -sum(
+                    task.result()
+                    for task in tasks
+                    if not task.cancelled() and task.exception() is None
+                )
+            )
+            _, rest = err.split(UnusableRangeError)
+            if rest is not None:
+                # The album's error summary doesn't look inside nested groups.
+                raise rest.exceptions[0]
+            LOGGER.warning("Server didn't send ranges as asked for %s", url)
+            await download_stream(url, filename, session, output, progress, 0)
+    else:
+        await download_stream(url, filename, session, output, progress, offset)
     LOGGER.info("Downloaded file in %s: %s", output.album_directory.name, filename)
 
 
@@ -138,30 +567,39 @@ async def process_download_page(
     prefer_flac: bool,
     output: DirectoryOutput,
     progress: tqdm,
+    page_semaphore: asyncio.Semaphore,
+    download_semaphore: asyncio.Semaphore,
+    split: int,
 ) -> None:
     """Glues the parsing and downloading together for use as a task."""
-    async with session.get(url) as resp:
-        # URL join just in case it's a relative link.
-        download_doc = html.document_fromstring(await resp.text())
+    async with page_semaphore:
+        download_doc = await fetch_document(url, session)
     try:
-        audio_link = urljoin(url, get_song_link(download_doc, prefer_flac))
+        # URL join just in case it's a relative link.
+        audio_link = join_url(url, get_song_link(download_doc, prefer_flac))
     except ValueError as err:
         raise KHOutsiderError(f"Could not find song links on {url}") from err
-    await download_file(audio_link, session, output, progress)
+    del download_doc
+    async with download_semaphore:
+        await download_file(
+            audio_link,
+            get_song_filename(audio_link),
+            session,
+            output,
+            progress,
+            split,
+        )
 
 
 def get_track_count(album_doc: html.HtmlElement) -> int:
     """Gets the number of tracks on the album from the document."""
-    try:
-        info_paragraph = (
-            album_doc.find(".//p[@align='left']").text_content().splitlines()
-        )
-    except IndexError:
+    info_paragraph = INFO_XPATH(album_doc)
+    if not info_paragraph:
         raise ValueError("No info paragraph found in page.")
-    for line in info_paragraph:
-        if "Number of Files" in line:
-            return int(line.split(":")[-1])
-    raise ValueError("Info Paragraph did not contain number of files.")
+    match = TRACK_COUNT_RE.search(info_paragraph)
+    if match is None:
+        raise ValueError("Info Paragraph did not contain number of files.")
+    return int(match[1])
 
 
 async def download_album(
@@ -171,12 +609,14 @@ async def download_album(
     output_format: Literal["directory", "tar", "zip"],
     session: aiohttp_retry.RetryClient,
     progress: tqdm,
+    page_semaphore: asyncio.Semaphore,
+    download_semaphore: asyncio.Semaphore,
+    split: int,
 ) -> None:
     """Top level imperative code for downloading an album."""
 
     try:
-        async with session.get(url) as resp:
-            album_doc = html.document_fromstring(await resp.text())
+        album_doc = await fetch_document(url, session)
         LOGGER.info("Obtained list URL for %s", url)
     except aiohttp.ClientError as err:
         LOGGER.error("An error occurred in fetching the album at %s: %s", url, err)
@@ -191,6 +631,8 @@ async def download_album(
         LOGGER.info("%s songs available for %s", track_count, album_name)
     except ValueError as err:
         LOGGER.warning("Could not find album info for %s: %s", album_name, err)
+    download_page_urls = DOWNLOAD_PAGE_XPATH(album_doc)
+    del album_doc
     match output_format:
         case "directory":
             output_type = DirectoryOutput
@@ -203,17 +645,19 @@ async def download_album(
             output_type(output_directory, album_name) as output,
             asyncio.TaskGroup() as tg,
         ):
-            download_page_urls = album_doc.find_class("playlistDownloadSong")
             if len(download_page_urls) == 0:
                 raise KHOutsiderError(f"No songs found on {url}")
             for download_page_url in download_page_urls:
                 tg.create_task(
                     process_download_page(
-                        urljoin(url, download_page_url.find("a").get("href")),
+                        join_url(url, download_page_url),
                         session,
                         prefer_flac,
                         output,
                         progress,
+                        page_semaphore,
+                        download_semaphore,
+                        split,
                     )
                 )
     except ExceptionGroup as err:
@@ -224,7 +668,7 @@ async def download_album(
         match, rest = err.split((aiohttp.ClientError, KHOutsiderError))
         if match is not None:
             for exc in match.exceptions:
-                LOGGER.error(str(exc))
+                LOGGER.error("%s", exc)
         if rest is not None:
             LOGGER.error("Unexpected errors occurred. Raising.")
             raise rest
@@ -236,6 +680,9 @@ async def download_albums(
     output_directory: pathlib.Path,
     output_format: Literal["directory", "tar", "zip"],
     progress_bar: bool,
+    max_concurrency: int,
+    max_page_fetches: int,
+    split: int,
 ) -> None:
     """Concurrently download multiple albums."""
     # gather is fragile. doesn't handle KeyboardInterrupt or SystemExit well, etc.
@@ -247,9 +694,28 @@ async def download_albums(
         total=0, unit="byte", unit_scale=True, disable=None if progress_bar else True
     )
 
-    retry_options = aiohttp_retry.JitterRetry(attempts=5)
+    page_semaphore = asyncio.Semaphore(max_page_fetches)
+    download_semaphore = asyncio.Semaphore(max_concurrency)
+
+    retry_options = BackoffRetry(
+        attempts=4,
+        start_timeout=0.5,
+        max_timeout=8.0,
+        factor=2.0,
+        statuses={429, 500, 502, 503, 504},
+        exceptions={aiohttp.ClientConnectionError, asyncio.TimeoutError},
+        retry_all_server_errors=False,
+    )
+    # Room for everything the semaphores let through, plus the album pages.
+    connections = max_page_fetches + max_concurrency * split + len(urls)
+    connector = aiohttp.TCPConnector(
+        limit=connections,
+        limit_per_host=connections,
+        ttl_dns_cache=600,
+        keepalive_timeout=30,
+    )
     async with aiohttp_retry.RetryClient(
-        raise_for_status=True, retry_options=retry_options
+        connector=connector, raise_for_status=True, retry_options=retry_options
     ) as session:
         exceptions = [
             x
@@ -262,6 +728,9 @@ async def download_albums(
                         output_format,
                         session,
                         progress,
+                        page_semaphore,
+                        download_semaphore,
+                        split,
                     )
                     for url in urls
                 ),
@@ -311,6 +780,24 @@ def main() -> None:
     parser.add_argument(
         "-p", "--progress-bar", action="store_true", help="Display a progress bar."
     )
+    parser.add_argument(
+        "--max-concurrency",
+        default=8,
+        type=int,
+        help="The maximum number of songs to download at the same time.",
+    )
+    parser.add_argument(
+        "--max-page-fetches",
+        default=8,
+        type=int,
+        help="The maximum number of song pages to fetch at the same time.",
+    )
+    parser.add_argument(
+        "--split",
+        default=1,
+        type=int,
+        help="Download files of 50 MiB or more as this many concurrent ranges.",
+    )
 
     args = parser.parse_args()
 
@@ -319,19 +806,36 @@ def main() -> None:
     if args.verbose:
         root_logger.setLevel(logging.INFO)
 
+    if args.max_concurrency < 1:
+        root_logger.error("Maximum concurrency must be at least 1.")
+        return
+
+    if args.max_page_fetches < 1:
+        root_logger.error("Maximum page fetches must be at least 1.")
+        return
+
+    if args.split < 1:
+        root_logger.error("Split must be at least 1.")
+        return
+
     if not args.output_directory.is_dir():
         root_logger.error("Output directory %s does not exist.", args.output_directory)
         return
 
-    asyncio.run(
-        download_albums(
-            args.urls,
-            args.prefer_flac,
-            args.output_directory,
-            args.output_format,
-            args.progress_bar,
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(
+            download_albums(
+                args.urls,
+                args.prefer_flac,
+                args.output_directory,
+                args.output_format,
+                args.progress_bar,
+                args.max_concurrency,
+                args.max_page_fetches,
+                args.split,
+            )
         )
-    )
 
 
 if __name__ == "__main__":